@@ -0,0 +1,130 @@
+"""
+Benchmark: API key middleware throughput
+
+Compares requests/sec of the pure ASGI `APIKeyMiddleware` against the previous
+`BaseHTTPMiddleware` implementation. Both wrap the same Starlette app and are
+driven in-process through httpx.ASGITransport, so the numbers isolate the
+middleware cost from network and uvicorn overhead.
+
+Scenarios:
+    json      small JSON response, key sent as a Bearer token
+    stream    streaming response of many small chunks (like an SSE stream)
+    session   requests inside an authenticated session (new middleware only)
+
+Usage:
+    uv run python benchmarks/bench_auth_middleware.py --requests 5000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "servers" / "weather" / "sse"))
+
+from auth import APIKeyMiddleware  # noqa: E402
+from ratelimit import RateLimiter  # noqa: E402
+from user_db import validate_api_key, get_user_by_api_key  # noqa: E402
+
+API_KEY = "password123"
+SESSION_ID = "0123456789abcdef0123456789abcdef"
+
+
+class LegacyAPIKeyMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation this benchmark compares against."""
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path in ["/docs", "/redoc", "/openapi.json"]:
+            return await call_next(request)
+        if request.url.path.startswith('/messages/') or request.url.path == '/messages':
+            return await call_next(request)
+
+        api_key = request.headers.get("x-api-key")
+        if not api_key:
+            auth_header = request.headers.get("Authorization")
+            if auth_header and auth_header.startswith("Bearer "):
+                api_key = auth_header[7:]
+        if not api_key:
+            api_key = request.query_params.get("api_key")
+
+        if not api_key or not validate_api_key(api_key):
+            return JSONResponse(status_code=401, content={"detail": "Invalid or missing API key"})
+
+        request.state.user = get_user_by_api_key(api_key)
+        return await call_next(request)
+
+
+async def json_endpoint(request: Request):
+    return JSONResponse({"jsonrpc": "2.0", "id": 1, "result": {}})
+
+
+async def stream_endpoint(request: Request):
+    async def chunks():
+        for i in range(50):
+            yield f"event: message\r\ndata: {i}\r\n\r\n".encode()
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+def build_app() -> Starlette:
+    return Starlette(routes=[
+        Route("/mcp", json_endpoint, methods=["GET", "POST"]),
+        Route("/stream", stream_endpoint),
+    ])
+
+
+async def run(app, path: str, headers: dict, requests: int, concurrency: int) -> float:
+    """Send `requests` GETs with at most `concurrency` in flight; return requests/sec."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get(path, headers=headers)
+                assert response.status_code == 200, response.status_code
+
+        # Warm up
+        await client.get(path, headers=headers)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark API key middleware implementations")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent requests")
+    args = parser.parse_args()
+
+    bearer = {"Authorization": f"Bearer {API_KEY}"}
+    legacy = LegacyAPIKeyMiddleware(build_app())
+    # Limits high enough never to reject, so the limiter's bookkeeping is measured
+    unlimited = (1e9, 1e9)
+    asgi_app = APIKeyMiddleware(build_app(), limiter=RateLimiter({"admin": unlimited}, global_limit=unlimited))
+
+    # Bind a session the way an SSE/streamable-http handshake would
+    asgi_app._bind(SESSION_ID, get_user_by_api_key(API_KEY))
+    session = {"mcp-session-id": SESSION_ID}
+
+    print(f"{'scenario':<10} {'BaseHTTPMiddleware':>20} {'pure ASGI':>12} {'speedup':>9}")
+    for name, path, headers in [("json", "/mcp", bearer), ("stream", "/stream", bearer)]:
+        before = await run(legacy, path, headers, args.requests, args.concurrency)
+        after = await run(asgi_app, path, headers, args.requests, args.concurrency)
+        print(f"{name:<10} {before:>16.0f} r/s {after:>8.0f} r/s {after / before:>8.2f}x")
+
+    after = await run(asgi_app, "/mcp", session, args.requests, args.concurrency)
+    print(f"{'session':<10} {'-':>20} {after:>8.0f} r/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
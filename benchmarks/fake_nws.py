@@ -0,0 +1,197 @@
+"""
+Fake NWS API for offline load tests
+
+Serves the subset of api.weather.gov used by the weather servers from the
+GeoJSON fixtures in `benchmarks/fixtures/nws`, with configurable latency and
+error injection, and counts every request so a load test can report how many
+upstream calls the servers made. Point a server at it with NWS_API_BASE:
+
+    uv run python benchmarks/fake_nws.py --port 8900 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+    NWS_API_BASE=http://127.0.0.1:8900 uv run python src/servers/weather/sse/mcp-weather.py
+
+Endpoints:
+    GET  /points/{lat},{lon}                 Gridpoint lookup; nearby points share a grid
+    GET  /gridpoints/{office}/{x},{y}/forecast
+    GET  /alerts/active/area/{state}         Honors If-None-Match with 304
+    GET  /alerts/active?area=&zone=&severity=&event=
+    GET  /__stats                            Request counts by endpoint and status
+    POST /__reset                            Reset the counters
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import random
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "nws"
+
+# Grid cells are about 0.1 degrees, so points closer than that share a forecast
+GRID_SIZE = 0.1
+
+
+class FakeNWS:
+    """Fixture-backed NWS stand-in with latency and error injection."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        alerts_change_every: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.alerts_change_every = alerts_change_every
+        self.random = random.Random(seed)
+        self.points = json.loads((FIXTURES / "points.json").read_text())
+        self.forecast = (FIXTURES / "forecast.json").read_bytes()
+        self.alerts = json.loads((FIXTURES / "alerts.json").read_text())
+        self.requests: Counter[str] = Counter()
+        self.statuses: Counter[str] = Counter()
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/points/{coordinates}", self.get_points),
+            Route("/gridpoints/{office}/{grid}/forecast", self.get_forecast),
+            Route("/alerts/active/area/{state}", self.get_alerts_area),
+            Route("/alerts/active", self.get_alerts),
+            Route("/__stats", self.get_stats),
+            Route("/__reset", self.reset, methods=["POST"]),
+        ])
+
+    async def _upstream(self, endpoint: str) -> Response | None:
+        """Count the request, wait the injected latency and maybe fail it."""
+        self.requests[endpoint] += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self._respond(JSONResponse(
+                {"title": "Service Unavailable", "status": 503, "detail": "Injected error"},
+                status_code=503,
+            ))
+        return None
+
+    def _respond(self, response: Response) -> Response:
+        self.statuses[str(response.status_code)] += 1
+        return response
+
+    async def get_points(self, request: Request) -> Response:
+        if error := await self._upstream("points"):
+            return error
+        try:
+            latitude, longitude = (float(value) for value in request.path_params["coordinates"].split(","))
+        except ValueError:
+            return self._respond(JSONResponse({"title": "Invalid Parameter", "status": 400}, status_code=400))
+
+        grid_x = int((longitude + 180) / GRID_SIZE)
+        grid_y = int((latitude + 90) / GRID_SIZE)
+        base = str(request.base_url).rstrip("/")
+        grid = f"{base}/gridpoints/FAK/{grid_x},{grid_y}"
+
+        doc = copy.deepcopy(self.points)
+        doc["id"] = f"{base}/points/{latitude},{longitude}"
+        doc["geometry"]["coordinates"] = [longitude, latitude]
+        props = doc["properties"]
+        props.update({
+            "@id": doc["id"],
+            "cwa": "FAK",
+            "gridId": "FAK",
+            "gridX": grid_x,
+            "gridY": grid_y,
+            "forecast": f"{grid}/forecast",
+            "forecastHourly": f"{grid}/forecast/hourly",
+            "forecastGridData": grid,
+            "observationStations": f"{grid}/stations",
+        })
+        return self._respond(JSONResponse(doc, media_type="application/geo+json"))
+
+    async def get_forecast(self, request: Request) -> Response:
+        if error := await self._upstream("forecast"):
+            return error
+        return self._respond(Response(self.forecast, media_type="application/geo+json"))
+
+    async def get_alerts_area(self, request: Request) -> Response:
+        return await self._alerts(request, area=request.path_params["state"].upper())
+
+    async def get_alerts(self, request: Request) -> Response:
+        return await self._alerts(request, area=request.query_params.get("area"))
+
+    async def _alerts(self, request: Request, area: str | None) -> Response:
+        if error := await self._upstream("alerts"):
+            return error
+
+        # The document "changes" every alerts_change_every seconds
+        version = int(time.time() // self.alerts_change_every) if self.alerts_change_every else 0
+        query = str(request.url.query)
+        etag = f'"{area}-{zlib.crc32(query.encode()):x}-{version}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(version * self.alerts_change_every)),
+        }
+        if request.headers.get("if-none-match") == etag:
+            return self._respond(Response(status_code=304, headers=headers))
+
+        features = self.alerts["features"]
+        params = request.query_params
+        if zone := params.get("zone"):
+            features = [f for f in features if zone in f["properties"]["geocode"]["UGC"]]
+        if severity := params.get("severity"):
+            severities = set(severity.split(","))
+            features = [f for f in features if f["properties"]["severity"] in severities]
+        if event := params.get("event"):
+            features = [f for f in features if f["properties"]["event"] == event]
+
+        doc = {**self.alerts, "features": features, "title": f"Current watches, warnings, and advisories for {area}"}
+        return self._respond(JSONResponse(doc, media_type="application/geo+json", headers=headers))
+
+    async def get_stats(self, request: Request) -> Response:
+        return JSONResponse({
+            "requests": dict(self.requests),
+            "total": sum(self.requests.values()),
+            "statuses": dict(self.statuses),
+        })
+
+    async def reset(self, request: Request) -> Response:
+        self.requests.clear()
+        self.statuses.clear()
+        return JSONResponse({"reset": True})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake NWS API for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
+    parser.add_argument("--port", type=int, default=8900, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed latency added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency, uniform in [0, jitter]")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--alerts-change-every", type=float, default=0.0,
+                        help="Seconds between alert document versions (0 = never changes)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for jitter and errors")
+    args = parser.parse_args()
+
+    fake = FakeNWS(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        alerts_change_every=args.alerts_change_every,
+        seed=args.seed,
+    )
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
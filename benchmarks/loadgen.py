@@ -0,0 +1,285 @@
+"""
+Load generator for the weather MCP servers
+
+Drives the stdio, SSE and streamable-http weather servers through real MCP
+client sessions against the fake NWS API (`fake_nws.py`), and reports
+throughput, p50/p95/p99 tool call latency and the number of upstream NWS
+calls each run caused.
+
+Each transport run starts its own server with NWS_API_BASE pointed at the
+fake NWS and rate limits disabled, opens `--sessions` concurrent sessions and
+has each make `--calls` tool calls drawn from a seeded mix of get_alerts and
+get_forecast. The stdio transport spawns one server process per session, as
+a stdio client always does, so its caches are not shared between sessions.
+
+Usage:
+    uv run python benchmarks/loadgen.py --transport sse streamable-http --sessions 20 --calls 50
+    uv run python benchmarks/loadgen.py --transport streamable-http --workers 4 --latency-ms 80 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable
+
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVERS = ROOT / "src" / "servers" / "weather"
+FAKE_NWS = Path(__file__).resolve().parent / "fake_nws.py"
+
+TRANSPORTS = ("stdio", "sse", "streamable-http")
+STATES = ("CA", "TX", "NY", "FL", "WA", "IL", "CO", "AZ", "OR", "GA")
+
+# Tool results that mean the call did not produce weather data
+ERROR_PREFIXES = ("Unable to fetch", "Rate limit exceeded")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port: int, process: asyncio.subprocess.Process, timeout: float = 30.0) -> None:
+    """Wait until something listens on `port`, failing early if `process` exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before listening on port {port}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout:.0f}s")
+
+
+@asynccontextmanager
+async def spawn(*args: str, port: int, cwd: Path, env: dict[str, str]) -> AsyncIterator[None]:
+    """Run a server process for the duration of the context."""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, *args,
+        cwd=cwd,
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await wait_for_port(port, process)
+        yield
+    finally:
+        if process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+
+@asynccontextmanager
+async def fake_nws(args: argparse.Namespace) -> AsyncIterator[str]:
+    """Yield the base URL of a fake NWS API, starting one unless --nws-url is given."""
+    if args.nws_url:
+        yield args.nws_url.rstrip("/")
+        return
+    port = free_port()
+    async with spawn(
+        str(FAKE_NWS),
+        "--port", str(port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate),
+        "--alerts-change-every", str(args.alerts_change_every),
+        "--seed", str(args.seed),
+        port=port,
+        cwd=ROOT,
+        env=dict(os.environ),
+    ):
+        yield f"http://127.0.0.1:{port}"
+
+
+def server_env(nws_url: str) -> dict[str, str]:
+    """Environment for a weather server under test: fake upstream, no rate limits."""
+    env = dict(os.environ)
+    env["NWS_API_BASE"] = nws_url
+    for scope in ("HTTP", "TOOL"):
+        for role in ("ADMIN", "DEVELOPER", "VIEWER", "GLOBAL"):
+            env[f"WEATHER_RATE_{scope}_{role}"] = "0"
+    return env
+
+
+@asynccontextmanager
+async def weather_server(
+    transport: str,
+    args: argparse.Namespace,
+    nws_url: str,
+) -> AsyncIterator[Callable[[], Any]]:
+    """Start the server for `transport` and yield a factory of MCP client streams."""
+    env = server_env(nws_url)
+    headers = {"x-api-key": args.api_key}
+
+    if transport == "stdio":
+        params = StdioServerParameters(command=sys.executable, args=["weather.py"], cwd=SERVERS / "stdio", env=env)
+        with open(os.devnull, "w") as devnull:
+            yield lambda: stdio_client(params, errlog=devnull)
+        return
+
+    port = free_port()
+    command = ["mcp-weather.py", "--host", "127.0.0.1", "--port", str(port)]
+    if transport == "sse":
+        async with spawn(*command, port=port, cwd=SERVERS / "sse", env=env):
+            yield lambda: sse_client(f"http://127.0.0.1:{port}/sse", headers=headers)
+    else:
+        command += ["--workers", str(args.workers)]
+        with tempfile.TemporaryDirectory() as tmp:
+            # Start every run with an empty shared cache
+            env["NWS_SHARED_CACHE"] = os.path.join(tmp, "cache.db")
+            async with spawn(*command, port=port, cwd=SERVERS / "streamable-http", env=env):
+                yield lambda: streamablehttp_client(f"http://127.0.0.1:{port}/mcp", headers=headers)
+
+
+class Workload:
+    """Seeded mix of get_alerts and get_forecast calls over fixed states and locations."""
+
+    def __init__(self, seed: int, states: int, locations: int, alerts_ratio: float):
+        self.random = random.Random(seed)
+        self.states = STATES[:max(1, states)]
+        # Spread across the continental US so locations land on distinct grids
+        self.locations = [
+            (round(self.random.uniform(25.0, 49.0), 4), round(self.random.uniform(-124.0, -67.0), 4))
+            for _ in range(locations)
+        ]
+        self.alerts_ratio = alerts_ratio
+
+    def next_call(self) -> tuple[str, dict[str, Any]]:
+        if self.random.random() < self.alerts_ratio:
+            return "get_alerts", {"state": self.random.choice(self.states)}
+        latitude, longitude = self.random.choice(self.locations)
+        return "get_forecast", {"latitude": latitude, "longitude": longitude}
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def run_transport(transport: str, args: argparse.Namespace, nws_url: str) -> dict[str, Any]:
+    """Run the workload against one transport and return its measurements."""
+    workload = Workload(args.seed, args.states, args.locations, args.alerts_ratio)
+    latencies: list[float] = []
+    errors = 0
+    start = asyncio.Event()
+    ready = 0
+
+    async with httpx.AsyncClient(base_url=nws_url) as nws:
+        await nws.post("/__reset")
+
+        async with weather_server(transport, args, nws_url) as open_streams:
+
+            async def session_worker() -> None:
+                nonlocal errors, ready
+                async with AsyncExitStack() as stack:
+                    streams = await stack.enter_async_context(open_streams())
+                    session = await stack.enter_async_context(ClientSession(streams[0], streams[1]))
+                    await session.initialize()
+                    ready += 1
+                    if ready == args.sessions:
+                        start.set()
+                    await start.wait()
+                    for _ in range(args.calls):
+                        name, arguments = workload.next_call()
+                        began = time.perf_counter()
+                        result = await session.call_tool(name, arguments)
+                        latencies.append(time.perf_counter() - began)
+                        text = result.content[0].text if result.content else ""
+                        if result.isError or text.startswith(ERROR_PREFIXES):
+                            errors += 1
+
+            workers = [asyncio.create_task(session_worker()) for _ in range(args.sessions)]
+            await start.wait()
+            began = time.perf_counter()
+            await asyncio.gather(*workers)
+            elapsed = time.perf_counter() - began
+
+        upstream = (await nws.get("/__stats")).json()
+
+    latencies.sort()
+    return {
+        "transport": transport,
+        "sessions": args.sessions,
+        "calls": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "upstream": upstream,
+    }
+
+
+def print_report(results: list[dict[str, Any]]) -> None:
+    print(f"{'transport':<16} {'calls':>6} {'errors':>6} {'calls/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'upstream':>9}  breakdown")
+    for r in results:
+        breakdown = ", ".join(f"{name}={count}" for name, count in sorted(r["upstream"]["requests"].items()))
+        print(
+            f"{r['transport']:<16} {r['calls']:>6} {r['errors']:>6} {r['throughput']:>9.1f} "
+            f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['upstream']['total']:>9}  {breakdown}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the weather MCP servers against a fake NWS API")
+    parser.add_argument("--transport", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS),
+                        help="Transports to test, in order")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent MCP client sessions")
+    parser.add_argument("--calls", type=int, default=50, help="Tool calls per session")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for streamable-http")
+    parser.add_argument("--states", type=int, default=5, help=f"Distinct states queried (max {len(STATES)})")
+    parser.add_argument("--locations", type=int, default=20, help="Distinct forecast locations queried")
+    parser.add_argument("--alerts-ratio", type=float, default=0.5, help="Fraction of calls that are get_alerts")
+    parser.add_argument("--api-key", default="password123", help="API key for the HTTP servers")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the workload and the fake NWS")
+    parser.add_argument("--nws-url", help="Use an already running fake NWS instead of starting one")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake NWS latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Fake NWS latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake NWS 503 rate")
+    parser.add_argument("--alerts-change-every", type=float, default=0.0,
+                        help="Seconds between fake alert document versions (0 = never changes)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    async with fake_nws(args) as nws_url:
+        for transport in args.transport:
+            results.append(await run_transport(transport, args, nws_url))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
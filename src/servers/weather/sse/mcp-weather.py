@@ -1,94 +1,69 @@
 # https://github.com/sidharthrajaram/mcp-sse/tree/main
-import httpx
+import json
+from contextlib import asynccontextmanager
+
 import uvicorn
-from typing import Any
 
 from mcp.server.fastmcp import FastMCP, Context
 from fastapi import FastAPI
 from starlette.routing import Mount
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import JSONResponse
 
-from user_db import validate_api_key, get_user_by_api_key
+from auth import APIKeyMiddleware
+from metrics import instrument_tool, metrics_endpoint
+from ratelimit import rate_limit_stats, retry_after, tool_limiter
+from nws_client import (
+    ALERT_SEVERITIES,
+    BATCH_MAX_LOCATIONS,
+    Location,
+    cache_stats,
+    fetch_alerts,
+    fetch_forecast,
+    fetch_forecasts_batch,
+    normalize_severity,
+    nws_lifespan,
+    paginate,
+    resolve_forecast_url,
+)
+
+# 初始化Weather工具的FastMCP伺服器(SSE)
+mcp = FastMCP(
+    name="weather",
+    lifespan=nws_lifespan,  # 共用的 NWS 連線池
+)
 
-class APIKeyMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware for API key authentication.
-    Accepts API key either via x-api-key header, as a Bearer token, or as a query parameter.
-    """
-    async def dispatch(self, request: Request, call_next):
-
-        # Skip authentication for docs and schema endpoints
-        if request.url.path in ["/docs", "/redoc", "/openapi.json"]:
-            return await call_next(request)
-            
-        # For n8n community node, Cursor MCP or other clients that authorize via query parameter
-        if request.url.path.startswith('/messages/') or request.url.path == '/messages':
-           return await call_next(request)
-            
-        # Try to get API key from multiple sources
-        
-        # 1. HEADER AUTHENTICATION
-        api_key = request.headers.get("x-api-key")
-         
-        # 2. BEARER AUTHENTICATION
-        if not api_key:
-            auth_header = request.headers.get("Authorization")
-            if auth_header and auth_header.startswith("Bearer "):
-                api_key = auth_header[7:]  # Remove "Bearer " prefix
-        
-        # 3. QUERY PARAMETER AUTHENTICATION
-        if not api_key:
-            api_key = request.query_params.get("api_key")
-         
-        if not api_key or not validate_api_key(api_key):
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Invalid or missing API key"}
-            )
-            
-        # Add user info to request state
-        request.state.user = get_user_by_api_key(api_key)
-        
-        # Continue processing the request
-        return await call_next(request)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Keep the NWS pool and refresher running for the life of the process."""
+    async with nws_lifespan(mcp):
+        yield
 
 
 # Create a FastAPI app
 app = FastAPI(
     title="MCP Weather API Server",
     description="MCP Server for Weather Tools",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
-# 初始化Weather工具的FastMCP伺服器(SSE)
-mcp = FastMCP(
-    name="weather"
-)
+# Prometheus metrics, registered before the catch-all MCP mount
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
 
 # Mount the MCP SSE app to the root path
 app.router.routes.append(Mount('/', app=mcp.sse_app()))
 # Add authentication middleware
 app.add_middleware(APIKeyMiddleware)
 
-# Constants
-NWS_API_BASE = "https://api.weather.gov"
-USER_AGENT = "weather-app/1.0"
-
-async def make_nws_request(url: str) -> dict[str, Any] | None:
-    """Make a request to the NWS API with proper error handling."""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json"
-    }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception:
-            return None
+
+def check_rate_limit(ctx: Context, cost: int = 1) -> str | None:
+    """Charge a tool call to the caller's tool rate limit; return an error message if over it."""
+    request = ctx.request_context.request
+    user = request.scope.get("user") if request is not None else None
+    wait = tool_limiter.acquire(user, cost)
+    if wait > 0:
+        return f"Rate limit exceeded. Retry after {retry_after(wait)} seconds."
+    return None
 
 
 def format_alert(feature: dict) -> str:
@@ -103,30 +78,74 @@ Instructions: {props.get('instruction', 'No specific instructions provided')}
 """
 
 
+def format_period(period: dict) -> str:
+    """Format a forecast period into a readable string."""
+    return f"""
+{period['name']}:
+Temperature: {period['temperature']}°{period['temperatureUnit']}
+Wind: {period['windSpeed']} {period['windDirection']}
+Forecast: {period['detailedForecast']}
+"""
+
+
 @mcp.tool()
-async def get_alerts(state: str, ctx: Context) -> str:
+@instrument_tool
+async def get_alerts(
+    state: str,
+    ctx: Context,
+    severity: str | None = None,
+    event: str | None = None,
+    zone: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> str:
     """Get weather alerts for a US state.
 
     Args:
         state: Two-letter US state code (e.g. CA, NY)
+        severity: Only return alerts of this severity: Extreme, Severe, Moderate, Minor or Unknown (comma-separated for several)
+        event: Only return alerts of this event type (e.g. "Flood Warning")
+        zone: Only return alerts for this NWS zone ID (e.g. CAZ041) instead of the whole state
+        limit: Maximum number of alerts to return
+        cursor: Cursor from a previous response, to get the next page
     """
+    if severity:
+        severity = normalize_severity(severity)
+        if severity is None:
+            return f"Invalid severity. Use one of: {', '.join(ALERT_SEVERITIES)}."
+
+    limited = check_rate_limit(ctx)
+    if limited:
+        return limited
+
     await ctx.info(f"Fetching alerts for state: {state}")
-    url = f"{NWS_API_BASE}/alerts/active/area/{state}"
-    data = await make_nws_request(url)
+    data = await fetch_alerts(state, severity=severity, event=event, zone=zone)
 
     await ctx.info(f"Received data: {data}")
 
     if not data or "features" not in data:
         return "Unable to fetch alerts or no alerts found."
 
-    if not data["features"]:
+    features = data["features"]
+    if not features:
+        if severity or event or zone:
+            return "No active alerts match the given filters."
         return "No active alerts for this state."
 
-    alerts = [format_alert(feature) for feature in data["features"]]
+    page, next_cursor, error = paginate(features, limit, cursor)
+    if error:
+        return error
+    if not page:
+        return "No more alerts."
+
+    alerts = [format_alert(feature) for feature in page]
+    if next_cursor:
+        alerts.append(f"Showing {len(page)} of {len(features)} alerts. Next cursor: {next_cursor}")
     return "\n---\n".join(alerts)
 
 
 @mcp.tool()
+@instrument_tool
 async def get_forecast(latitude: float, longitude: float, ctx: Context) -> str:
     """Get weather forecast for a location.
 
@@ -134,43 +153,77 @@ async def get_forecast(latitude: float, longitude: float, ctx: Context) -> str:
         latitude: Latitude of the location
         longitude: Longitude of the location
     """
-    # First get the forecast grid endpoint
-    points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
+    limited = check_rate_limit(ctx)
+    if limited:
+        return limited
+
+    # First resolve the forecast grid endpoint (cached per location)
+    forecast_url = await resolve_forecast_url(latitude, longitude)
 
-    await ctx.info(f"Received data: {points_data}")
+    await ctx.info(f"Resolved forecast URL: {forecast_url}")
 
-    if not points_data:
+    if not forecast_url:
         return "Unable to fetch forecast data for this location."
 
-    # Get the forecast URL from the points response
-    forecast_url = points_data["properties"]["forecast"]
-    forecast_data = await make_nws_request(forecast_url)
+    forecast_data = await fetch_forecast(forecast_url)
 
     if not forecast_data:
         return "Unable to fetch detailed forecast."
 
     # Format the periods into a readable forecast
     periods = forecast_data["properties"]["periods"]
-    forecasts = []
-    for period in periods[:5]:  # Only show next 5 periods
-        forecast = f"""
-{period['name']}:
-Temperature: {period['temperature']}°{period['temperatureUnit']}
-Wind: {period['windSpeed']} {period['windDirection']}
-Forecast: {period['detailedForecast']}
-"""
-        forecasts.append(forecast)
-
+    forecasts = [format_period(period) for period in periods[:5]]  # Only show next 5 periods
     return "\n---\n".join(forecasts)
 
 
+@mcp.tool()
+@instrument_tool
+async def get_forecasts_batch(locations: list[Location], ctx: Context) -> str:
+    """Get weather forecasts for many locations in one call.
+
+    Locations are fetched concurrently and locations sharing a forecast grid
+    are only fetched once. A failure for one location does not fail the rest.
+
+    Args:
+        locations: List of {"latitude": ..., "longitude": ...} objects (at most 50)
+    """
+    if not locations:
+        return "No locations given."
+    if len(locations) > BATCH_MAX_LOCATIONS:
+        return f"Too many locations: {len(locations)} given, at most {BATCH_MAX_LOCATIONS} allowed."
+
+    # Each location counts against the tool rate limit
+    limited = check_rate_limit(ctx, cost=len(locations))
+    if limited:
+        return limited
+
+    coordinates = [(location["latitude"], location["longitude"]) for location in locations]
+    await ctx.info(f"Fetching forecasts for {len(coordinates)} locations")
+    results = await fetch_forecasts_batch(coordinates)
+
+    sections = []
+    for index, ((latitude, longitude), (forecast_data, error)) in enumerate(zip(coordinates, results), start=1):
+        header = f"=== Location {index} ({latitude}, {longitude}) ==="
+        if error:
+            sections.append(f"{header}\nError: {error}")
+            continue
+        periods = forecast_data["properties"]["periods"]
+        sections.append(header + "\n---\n".join(format_period(period) for period in periods[:5]))
+    return "\n\n".join(sections)
+
+
 @mcp.resource("weather://logs")
 async def get_logs() -> str:
     """Get the logs of the weather tool."""
     return "Logs are not available in this version."
 
 
+@mcp.resource("weather://stats")
+async def get_stats() -> str:
+    """Get hit/miss counters for the NWS caches and rate limit bucket levels."""
+    return json.dumps({**cache_stats(), "rate_limits": rate_limit_stats()})
+
+
 if __name__ == "__main__":
     """Run the MCP SSE-based server."""
     import argparse
@@ -180,9 +233,5 @@ if __name__ == "__main__":
     parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
     args = parser.parse_args()
 
-    mcp.settings.host = args.host
-    mcp.settings.port = args.port
-    mcp.run(
-        transport="sse"
-    )
-    uvicorn.run(app, host=mcp.settings.host, port=mcp.settings.port)
\ No newline at end of file
+    # Serve the FastAPI app so the authentication middleware applies
+    uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
@@ -0,0 +1,1205 @@
+"""
+Shared NWS API Client
+
+This module owns the process-wide HTTP client used by the weather tools, so
+every points, forecast and alerts fetch reuses pooled keep-alive connections
+to api.weather.gov instead of paying a new TCP/TLS handshake per request.
+
+Pool behaviour is configured through environment variables:
+
+    NWS_API_BASE                 NWS API root, e.g. a local stand-in (default https://api.weather.gov)
+    NWS_HTTP_MAX_CONNECTIONS     Maximum open connections (default 100)
+    NWS_HTTP_MAX_KEEPALIVE       Idle keep-alive connections kept (default 20)
+    NWS_HTTP_KEEPALIVE_EXPIRY    Seconds an idle connection is kept (default 30)
+    NWS_HTTP_TIMEOUT             Request timeout in seconds (default 30)
+    NWS_HTTP2                    Enable HTTP/2, needs `httpx[http2]` (default off)
+
+Resolved /points gridpoint lookups are kept in a bounded TTL/LRU cache:
+
+    NWS_POINTS_CACHE_SIZE        Maximum cached locations (default 4096)
+    NWS_POINTS_CACHE_TTL         Seconds a lookup stays valid (default 86400)
+    NWS_POINTS_PRECISION         Decimal places coordinates are rounded to (default 4)
+
+Active alerts (per state) and gridpoint forecasts are cached and revalidated
+with conditional requests (If-None-Match / If-Modified-Since), so an unchanged
+document costs a 304. Past its fresh window an entry may still be served for
+a stale window while it is revalidated in the background:
+
+    NWS_ALERTS_CACHE_SIZE        Maximum cached states (default 128)
+    NWS_ALERTS_FRESH_SECONDS     Seconds a state is served without revalidation (default 60)
+    NWS_ALERTS_STALE_SECONDS     Seconds past freshness a state may be served stale (default 300)
+    NWS_FORECAST_CACHE_SIZE      Maximum cached gridpoint forecasts (default 1024)
+    NWS_FORECAST_FRESH_SECONDS   Seconds a forecast is served without revalidation (default 600)
+    NWS_FORECAST_STALE_SECONDS   Seconds past freshness a forecast may be served stale (default 1800)
+
+Identical concurrent requests are coalesced: callers asking for the same URL
+while a fetch is in flight await that fetch instead of sending their own.
+
+While the server lifespan is active, a background scheduler tracks the most
+requested states and gridpoints and refreshes them ahead of expiry:
+
+    NWS_REFRESH_ENABLED          Run the background scheduler (default on)
+    NWS_REFRESH_INTERVAL         Seconds between scheduler passes (default 15)
+    NWS_HOT_SET_SIZE             Number of hottest URLs kept warm (default 50)
+    NWS_REFRESH_BUDGET           Maximum refreshes per pass (default 20)
+    NWS_PREFETCH_CONCURRENCY     Concurrent background fetches (default 4)
+
+Batch forecasts resolve shared gridpoints once and fetch concurrently:
+
+    NWS_BATCH_MAX_LOCATIONS      Maximum locations per batch call (default 50)
+    NWS_BATCH_CONCURRENCY        Concurrent upstream fetches per batch (default 8)
+
+When several worker processes serve the same host, the points, alerts and
+forecast caches can be backed by a shared SQLite database in WAL mode, so a
+document fetched by one worker is reused by the others:
+
+    NWS_SHARED_CACHE             Path of the shared cache database (default off)
+    NWS_SHARED_CACHE_MAX_AGE     Seconds after which shared rows are pruned (default 86400)
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Optional, TypedDict, TypeVar
+from urllib.parse import urlencode
+
+import httpx
+
+from metrics import REGISTRY, UPSTREAM_DURATION, UPSTREAM_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Location(TypedDict):
+    """A coordinate pair accepted by the batch forecast tool."""
+
+    latitude: float
+    longitude: float
+
+# Constants
+NWS_API_BASE = os.getenv("NWS_API_BASE", "https://api.weather.gov").rstrip("/")
+USER_AGENT = "weather-app/1.0"
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def endpoint_of(url: str) -> str:
+    """Classify an NWS URL for metrics: points, forecast, alerts or other."""
+    path = url[len(NWS_API_BASE):] if url.startswith(NWS_API_BASE) else url
+    if path.startswith("/points/"):
+        return "points"
+    if path.startswith("/gridpoints/"):
+        return "forecast"
+    if path.startswith("/alerts"):
+        return "alerts"
+    return "other"
+
+
+class SharedStore:
+    """
+    Cache rows shared between processes through an SQLite database.
+
+    The database runs in WAL mode so readers never block each other or the
+    writer. Rows hold a JSON value, optional validators and the wall-clock
+    time they were stored, so any process can tell how old an entry is.
+    Every operation is best effort: on an SQLite error it is logged and
+    treated as a miss, and the in-process caches keep working.
+    """
+
+    # Rows older than max_age are deleted after this many writes
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str, max_age: float = 86400.0):
+        self.path = path
+        self.max_age = max_age
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedStore"]:
+        """Build a store from NWS_SHARED_CACHE, or None when it is not set."""
+        path = os.getenv("NWS_SHARED_CACHE")
+        if not path:
+            return None
+        return cls(path, max_age=_env_float("NWS_SHARED_CACHE_MAX_AGE", 86400.0))
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The connection of this process, opened on first use."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " etag TEXT, last_modified TEXT, stored_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get(
+        self,
+        namespace: str,
+        key: str,
+        max_age: Optional[float] = None,
+    ) -> Optional[tuple[Any, Optional[str], Optional[str], float]]:
+        """
+        Read a row.
+
+        Args:
+            namespace: Cache the row belongs to, e.g. "alerts"
+            key: Key within the namespace
+            max_age: Ignore rows older than this many seconds
+
+        Returns:
+            (value, etag, last_modified, age in seconds), or None if missing
+        """
+        self.reads += 1
+        stored_after = time.time() - max_age if max_age is not None else 0.0
+        try:
+            row = self.conn.execute(
+                "SELECT value, etag, last_modified, stored_at FROM entries"
+                " WHERE namespace = ? AND key = ? AND stored_at > ?",
+                (namespace, key, stored_after),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Shared cache read failed: %s", e)
+            return None
+        if row is None:
+            return None
+        self.hits += 1
+        value, etag, last_modified, stored_at = row
+        return json.loads(value), etag, last_modified, max(0.0, time.time() - stored_at)
+
+    def put(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        age: float = 0.0,
+    ) -> None:
+        """Write a row stamped with the time it was fetched, `age` seconds ago."""
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), etag, last_modified, time.time() - age),
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Shared cache write failed: %s", e)
+            return
+        self.writes += 1
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= self.PRUNE_EVERY:
+            self.prune()
+
+    def touch(
+        self,
+        namespace: str,
+        key: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        age: float = 0.0,
+    ) -> None:
+        """Mark a row as revalidated `age` seconds ago without rewriting its value."""
+        try:
+            self.conn.execute(
+                "UPDATE entries SET etag = ?, last_modified = ?, stored_at = ? WHERE namespace = ? AND key = ?",
+                (etag, last_modified, time.time() - age, namespace, key),
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Shared cache write failed: %s", e)
+            return
+        self.writes += 1
+
+    def prune(self) -> None:
+        """Delete rows older than max_age."""
+        self._writes_since_prune = 0
+        try:
+            self.conn.execute("DELETE FROM entries WHERE stored_at < ?", (time.time() - self.max_age,))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Shared cache prune failed: %s", e)
+
+    def stats(self) -> dict[str, Any]:
+        """Return read/write counters."""
+        return {
+            "path": self.path,
+            "reads": self.reads,
+            "hits": self.hits,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache with LRU eviction and per-entry expiry.
+
+    Hit, miss and eviction counters are kept so the cache can be sized from
+    observed traffic. With a SharedStore, local misses fall back to entries
+    written by other processes and every set is shared with them.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        shared: Optional[SharedStore] = None,
+        namespace: str = "",
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.namespace = namespace
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Look up a key, refreshing its LRU position on a hit.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached value, or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self.shared is not None:
+            row = self.shared.get(self.namespace, repr(key), max_age=self.ttl)
+            if row is not None:
+                value, _, _, age = row
+                self._store(key, value, self.ttl - age)
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries when full."""
+        self._store(key, value, self.ttl)
+        if self.shared is not None:
+            self.shared.put(self.namespace, repr(key), value)
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        """Return size and hit/miss counters."""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+class ConditionalEntry:
+    """A cached document together with its upstream validators."""
+
+    __slots__ = ("value", "etag", "last_modified", "checked_at")
+
+    def __init__(self, value: Any, etag: Optional[str], last_modified: Optional[str]):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked_at
+
+    def is_fresh(self, fresh_for: float) -> bool:
+        return self.age() < fresh_for
+
+
+class ConditionalCache:
+    """
+    URL-keyed cache of decoded NWS documents and their ETag / Last-Modified.
+
+    Entries younger than `fresh_for` are served without touching the network.
+    Older entries are revalidated with a conditional request, so an unchanged
+    document costs a 304 with no body to download or parse. For `stale_for`
+    seconds past freshness an entry may be served while it is revalidated in
+    the background (see RefreshScheduler).
+
+    With a SharedStore, documents and revalidations are written through to
+    it, and `sync()` picks up newer copies fetched by other processes before
+    going upstream.
+    """
+
+    # Seconds by which a shared row must be newer than the local copy
+    SYNC_MARGIN = 0.01
+
+    def __init__(
+        self,
+        maxsize: int,
+        fresh_for: float,
+        stale_for: float = 0.0,
+        shared: Optional[SharedStore] = None,
+        namespace: str = "",
+    ):
+        self.maxsize = maxsize
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self.shared = shared
+        self.namespace = namespace
+        self._entries: OrderedDict[str, ConditionalEntry] = OrderedDict()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.shared_hits = 0
+
+    def get(self, url: str) -> Optional[ConditionalEntry]:
+        """Return the entry for a URL, fresh or not, refreshing its LRU position."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def set(self, url: str, entry: ConditionalEntry) -> None:
+        self._store(url, entry)
+        if self.shared is not None:
+            self.shared.put(self.namespace, url, entry.value, entry.etag, entry.last_modified, age=entry.age())
+
+    def _store(self, url: str, entry: ConditionalEntry) -> None:
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def touch(self, url: str, entry: ConditionalEntry, etag: Optional[str], last_modified: Optional[str]) -> None:
+        """Record a successful revalidation (304) of an entry."""
+        entry.checked_at = time.monotonic()
+        entry.etag = etag
+        entry.last_modified = last_modified
+        if self.shared is not None:
+            self.shared.touch(self.namespace, url, etag, last_modified, age=entry.age())
+
+    def sync(self, url: str) -> tuple[Optional[ConditionalEntry], bool]:
+        """
+        Return the entry for a URL, adopting a newer copy from the shared store.
+
+        Returns:
+            (entry or None, whether the entry came from the shared store)
+        """
+        entry = self.get(url)
+        if self.shared is None:
+            return entry, False
+        # Only rows checked upstream after the local copy are newer; the
+        # margin keeps this process's own write-through from matching
+        max_age = entry.age() - self.SYNC_MARGIN if entry is not None else None
+        row = self.shared.get(self.namespace, url, max_age=max_age)
+        if row is None:
+            return entry, False
+        value, etag, last_modified, age = row
+        entry = ConditionalEntry(value, etag, last_modified)
+        entry.checked_at -= age
+        self._store(url, entry)
+        return entry, True
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        """Return size and hit/revalidation/miss counters."""
+        lookups = self.hits + self.shared_hits + self.revalidated + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "fresh_for": self.fresh_for,
+            "stale_for": self.stale_for,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "hit_ratio": (self.hits + self.shared_hits + self.revalidated) / lookups if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one shared task.
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs await the same task. Each waiter is shielded, so cancelling
+    one waiter does not cancel the fetch for the others, while an exception
+    or cancellation of the shared task itself is raised in every waiter.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn` once for all concurrent callers sharing `key`.
+
+        Args:
+            key: Identity of the call, e.g. the request URL
+            fn: Zero-argument coroutine function doing the actual work
+
+        Returns:
+            The shared result of `fn`
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict[str, Any]:
+        """Return in-flight and coalescing counters."""
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+class NWSClient:
+    """
+    Pooled HTTP client for the NWS API.
+
+    The underlying httpx.AsyncClient is created on first use and shared by all
+    tool calls. FastMCP enters the server lifespan once per session on the
+    HTTP transports, so `lifespan()` is reference counted: the pool stays open
+    while any session holds it and is closed when the last one exits.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        http2: bool = False,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+        self._holders = 0
+        self.flights = SingleFlight()
+
+    @classmethod
+    def from_env(cls) -> "NWSClient":
+        """Build a client from the NWS_HTTP_* environment variables."""
+        return cls(
+            max_connections=_env_int("NWS_HTTP_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int("NWS_HTTP_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("NWS_HTTP_KEEPALIVE_EXPIRY", 30.0),
+            timeout=_env_float("NWS_HTTP_TIMEOUT", 30.0),
+            http2=_env_flag("NWS_HTTP2"),
+        )
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("NWS_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+        return httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/geo+json",
+            },
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=http2,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared httpx client, created lazily on first access."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    @asynccontextmanager
+    async def lifespan(self) -> AsyncIterator["NWSClient"]:
+        """Hold the shared pool open for the duration of the context."""
+        self._holders += 1
+        try:
+            yield self
+        finally:
+            self._holders -= 1
+            if self._holders == 0:
+                await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the pool and all of its connections."""
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> httpx.Response | None:
+        """
+        GET a URL through the shared pool.
+
+        Args:
+            url: The NWS API URL to fetch
+            headers: Extra request headers, e.g. conditional validators
+
+        Returns:
+            The response (2xx or 304), or None on any HTTP error
+        """
+        status = "error"
+        started = time.perf_counter()
+        UPSTREAM_IN_FLIGHT.inc()
+        try:
+            response = await self.client.get(url, headers=headers)
+            status = str(response.status_code)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            logger.warning("NWS request to %s failed: %s", url, e)
+            return None
+        finally:
+            UPSTREAM_IN_FLIGHT.dec()
+            UPSTREAM_DURATION.observe(time.perf_counter() - started, endpoint_of(url), status)
+
+    async def get_json(self, url: str) -> dict[str, Any] | None:
+        """
+        GET a URL and decode the JSON body.
+
+        Args:
+            url: The NWS API URL to fetch
+
+        Returns:
+            The decoded JSON document, or None on any HTTP or decoding error
+        """
+        return await self.flights.do(("json", url), lambda: self._get_json(url))
+
+    async def _get_json(self, url: str) -> dict[str, Any] | None:
+        response = await self.get(url)
+        if response is None:
+            return None
+        try:
+            return response.json()
+        except ValueError as e:
+            logger.warning("NWS response from %s is not valid JSON: %s", url, e)
+            return None
+
+    async def get_json_cached(self, url: str, cache: ConditionalCache) -> dict[str, Any] | None:
+        """
+        GET a URL through a ConditionalCache.
+
+        Fresh entries are returned as-is; stale entries are revalidated with
+        If-None-Match / If-Modified-Since. If the upstream request fails, the
+        last known document is served rather than nothing.
+
+        Args:
+            url: The NWS API URL to fetch
+            cache: The cache holding documents and validators for this URL
+
+        Returns:
+            The decoded JSON document, or None if nothing could be fetched
+        """
+        entry = cache.get(url)
+        if entry is not None and entry.is_fresh(cache.fresh_for):
+            cache.hits += 1
+            return entry.value
+        return await self.flights.do(("cached", url), lambda: self._revalidate(url, cache))
+
+    async def _revalidate(
+        self,
+        url: str,
+        cache: ConditionalCache,
+        fresh_for: Optional[float] = None,
+    ) -> dict[str, Any] | None:
+        entry, from_shared = cache.sync(url)
+        # Another process refreshed this document recently enough
+        if from_shared and entry.age() < (cache.fresh_for if fresh_for is None else fresh_for):
+            cache.shared_hits += 1
+            return entry.value
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = await self.get(url, headers=headers)
+        if response is None:
+            if entry is None:
+                return None
+            cache.stale_served += 1
+            return entry.value
+
+        if response.status_code == 304 and entry is not None:
+            cache.revalidated += 1
+            cache.touch(
+                url,
+                entry,
+                etag=response.headers.get("ETag", entry.etag),
+                last_modified=response.headers.get("Last-Modified", entry.last_modified),
+            )
+            return entry.value
+
+        try:
+            value = response.json()
+        except ValueError as e:
+            logger.warning("NWS response from %s is not valid JSON: %s", url, e)
+            return entry.value if entry is not None else None
+
+        cache.misses += 1
+        cache.set(url, ConditionalEntry(
+            value,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        ))
+        return value
+
+
+class RefreshScheduler:
+    """
+    Background refresher for the hottest cached NWS documents.
+
+    Every lookup through `fetch_cached()` bumps the URL's score; scores decay
+    by half on each pass so the hot set follows current traffic. Each pass
+    revalidates up to `budget` of the `hot_set_size` hottest URLs whose entry
+    would expire before the next pass, at most `concurrency` at a time.
+    Tool calls that find an entry inside its stale window get the cached
+    value immediately and a background revalidation is queued instead.
+    """
+
+    def __init__(
+        self,
+        client: NWSClient,
+        interval: float = 15.0,
+        hot_set_size: int = 50,
+        budget: int = 20,
+        concurrency: int = 4,
+        enabled: bool = True,
+    ):
+        self.client = client
+        self.interval = interval
+        self.hot_set_size = hot_set_size
+        self.budget = budget
+        self.concurrency = concurrency
+        self.enabled = enabled
+        self._scores: dict[str, float] = {}
+        self._caches: dict[str, ConditionalCache] = {}
+        self._pending: dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._holders = 0
+        self.passes = 0
+        self.prefetched = 0
+        self.background_revalidations = 0
+
+    @classmethod
+    def from_env(cls, client: NWSClient) -> "RefreshScheduler":
+        """Build a scheduler from the NWS_REFRESH_* environment variables."""
+        return cls(
+            client,
+            interval=_env_float("NWS_REFRESH_INTERVAL", 15.0),
+            hot_set_size=_env_int("NWS_HOT_SET_SIZE", 50),
+            budget=_env_int("NWS_REFRESH_BUDGET", 20),
+            concurrency=_env_int("NWS_PREFETCH_CONCURRENCY", 4),
+            enabled=_env_flag("NWS_REFRESH_ENABLED", True),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def touch(self, url: str, cache: ConditionalCache) -> None:
+        """Record a lookup of `url` in `cache`."""
+        self._scores[url] = self._scores.get(url, 0.0) + 1.0
+        self._caches[url] = cache
+
+    def revalidate_soon(self, url: str, cache: ConditionalCache) -> None:
+        """Queue a background revalidation unless one is already pending."""
+        if url in self._pending:
+            return
+        self.background_revalidations += 1
+        task = asyncio.ensure_future(self._refresh(url, cache))
+        self._pending[url] = task
+        task.add_done_callback(lambda t: self._pending.pop(url, None))
+
+    async def _refresh(self, url: str, cache: ConditionalCache) -> None:
+        # Skip the upstream request if another process already refreshed the
+        # entry so far that it would not be due on this pass
+        fresh_for = cache.fresh_for - self.interval
+        async with self._semaphore:
+            await self.client.flights.do(
+                ("cached", url), lambda: self.client._revalidate(url, cache, fresh_for=fresh_for)
+            )
+
+    async def run_once(self) -> int:
+        """
+        Run one scheduling pass.
+
+        Returns:
+            The number of URLs refreshed
+        """
+        self.passes += 1
+        hot = heapq.nlargest(self.hot_set_size, self._scores.items(), key=lambda item: item[1])
+
+        due = []
+        for url, _ in hot:
+            cache = self._caches[url]
+            entry = cache.get(url)
+            # Refresh entries that would go stale before the next pass
+            if entry is not None and entry.age() + self.interval >= cache.fresh_for and url not in self._pending:
+                due.append((url, cache))
+            if len(due) >= self.budget:
+                break
+
+        # Decay scores and forget URLs nobody asks for anymore
+        for url in list(self._scores):
+            score = self._scores[url] / 2
+            if score < 0.05:
+                del self._scores[url]
+                del self._caches[url]
+            else:
+                self._scores[url] = score
+
+        if due:
+            results = await asyncio.gather(*(self._refresh(url, cache) for url, cache in due), return_exceptions=True)
+            for (url, _), result in zip(due, results):
+                if isinstance(result, Exception):
+                    logger.warning("Background refresh of %s failed: %s", url, result)
+            self.prefetched += len(due)
+        return len(due)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("NWS refresh pass failed")
+
+    @asynccontextmanager
+    async def lifespan(self) -> AsyncIterator["RefreshScheduler"]:
+        """Run the scheduler while any holder is inside the context."""
+        self._holders += 1
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+        try:
+            yield self
+        finally:
+            self._holders -= 1
+            if self._holders == 0:
+                await self.stop()
+
+    async def stop(self) -> None:
+        """Cancel the scheduling loop and any pending background fetches."""
+        tasks = list(self._pending.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Return scheduler counters."""
+        return {
+            "running": self.running,
+            "tracked": len(self._scores),
+            "pending": len(self._pending),
+            "passes": self.passes,
+            "prefetched": self.prefetched,
+            "background_revalidations": self.background_revalidations,
+        }
+
+
+# Process-wide client shared by every tool call
+nws = NWSClient.from_env()
+refresher = RefreshScheduler.from_env(nws)
+
+# Cross-process store behind the caches below, when configured
+shared_store = SharedStore.from_env()
+
+# Gridpoint forecast URLs keyed by rounded coordinates
+points_cache = TTLCache(
+    maxsize=_env_int("NWS_POINTS_CACHE_SIZE", 4096),
+    ttl=_env_float("NWS_POINTS_CACHE_TTL", 86400.0),
+    shared=shared_store,
+    namespace="points",
+)
+POINTS_PRECISION = _env_int("NWS_POINTS_PRECISION", 4)
+
+# Active alerts documents keyed by URL, i.e. per state
+alerts_cache = ConditionalCache(
+    maxsize=_env_int("NWS_ALERTS_CACHE_SIZE", 128),
+    fresh_for=_env_float("NWS_ALERTS_FRESH_SECONDS", 60.0),
+    stale_for=_env_float("NWS_ALERTS_STALE_SECONDS", 300.0),
+    shared=shared_store,
+    namespace="alerts",
+)
+
+# Gridpoint forecast documents keyed by forecast URL
+forecast_cache = ConditionalCache(
+    maxsize=_env_int("NWS_FORECAST_CACHE_SIZE", 1024),
+    fresh_for=_env_float("NWS_FORECAST_FRESH_SECONDS", 600.0),
+    stale_for=_env_float("NWS_FORECAST_STALE_SECONDS", 1800.0),
+    shared=shared_store,
+    namespace="forecast",
+)
+
+BATCH_MAX_LOCATIONS = _env_int("NWS_BATCH_MAX_LOCATIONS", 50)
+BATCH_CONCURRENCY = _env_int("NWS_BATCH_CONCURRENCY", 8)
+
+
+@asynccontextmanager
+async def nws_lifespan(server: Any) -> AsyncIterator[None]:
+    """FastMCP lifespan that keeps the shared NWS pool and refresher running."""
+    async with nws.lifespan(), refresher.lifespan():
+        yield
+
+
+async def make_nws_request(url: str) -> dict[str, Any] | None:
+    """Make a request to the NWS API with proper error handling."""
+    return await nws.get_json(url)
+
+
+def points_key(latitude: float, longitude: float) -> tuple[float, float]:
+    """
+    Normalize coordinates for /points lookups.
+
+    NWS accepts at most four decimal places and redirects anything more
+    precise, so coordinates are rounded before being used as a URL or key.
+    """
+    # "+ 0.0" folds -0.0 into 0.0 so both map to the same key
+    return (
+        round(latitude, POINTS_PRECISION) + 0.0,
+        round(longitude, POINTS_PRECISION) + 0.0,
+    )
+
+
+async def resolve_forecast_url(latitude: float, longitude: float) -> str | None:
+    """
+    Resolve the gridpoint forecast URL for a location.
+
+    Args:
+        latitude: Latitude of the location
+        longitude: Longitude of the location
+
+    Returns:
+        The forecast URL, or None if the location could not be resolved
+    """
+    key = points_key(latitude, longitude)
+    forecast_url = points_cache.get(key)
+    if forecast_url is not None:
+        return forecast_url
+
+    points_data = await make_nws_request(f"{NWS_API_BASE}/points/{key[0]},{key[1]}")
+    if not points_data:
+        return None
+    forecast_url = points_data.get("properties", {}).get("forecast")
+    if forecast_url:
+        points_cache.set(key, forecast_url)
+    return forecast_url
+
+
+async def fetch_cached(url: str, cache: ConditionalCache) -> dict[str, Any] | None:
+    """
+    Fetch a document through a ConditionalCache with stale-while-revalidate.
+
+    While the refresh scheduler runs, an entry past its fresh window but
+    inside its stale window is returned immediately and revalidated in the
+    background; otherwise the lookup revalidates inline.
+
+    Args:
+        url: The NWS API URL to fetch
+        cache: The cache holding documents for this URL
+
+    Returns:
+        The decoded JSON document, or None if nothing could be fetched
+    """
+    refresher.touch(url, cache)
+    entry = cache.get(url)
+    if (
+        entry is not None
+        and refresher.running
+        and not entry.is_fresh(cache.fresh_for)
+        and entry.is_fresh(cache.fresh_for + cache.stale_for)
+    ):
+        cache.stale_served += 1
+        refresher.revalidate_soon(url, cache)
+        return entry.value
+    return await nws.get_json_cached(url, cache)
+
+
+async def fetch_forecast(forecast_url: str) -> dict[str, Any] | None:
+    """
+    Fetch a gridpoint forecast through the forecast cache.
+
+    Args:
+        forecast_url: Forecast URL as resolved by resolve_forecast_url()
+
+    Returns:
+        The forecast GeoJSON, or None if it could not be fetched
+    """
+    return await fetch_cached(forecast_url, forecast_cache)
+
+
+async def fetch_forecasts_batch(
+    coordinates: list[tuple[float, float]],
+) -> list[tuple[dict[str, Any] | None, str | None]]:
+    """
+    Fetch forecasts for many locations concurrently.
+
+    Locations that round to the same point, or resolve to the same gridpoint,
+    share a single upstream request. At most BATCH_CONCURRENCY requests run
+    at once.
+
+    Args:
+        coordinates: (latitude, longitude) pairs
+
+    Returns:
+        One (forecast GeoJSON, error message) pair per input location, in order
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def bounded(fn: Callable[..., Awaitable[T]], *args: Any) -> T:
+        async with semaphore:
+            return await fn(*args)
+
+    keys = [points_key(latitude, longitude) for latitude, longitude in coordinates]
+    unique_keys = list(dict.fromkeys(keys))
+    resolved = await asyncio.gather(
+        *(bounded(resolve_forecast_url, *key) for key in unique_keys),
+        return_exceptions=True,
+    )
+    url_by_key = {
+        key: url if isinstance(url, str) else None
+        for key, url in zip(unique_keys, resolved)
+    }
+
+    unique_urls = list(dict.fromkeys(url for url in url_by_key.values() if url))
+    documents = await asyncio.gather(
+        *(bounded(fetch_forecast, url) for url in unique_urls),
+        return_exceptions=True,
+    )
+    doc_by_url = {
+        url: doc if isinstance(doc, dict) else None
+        for url, doc in zip(unique_urls, documents)
+    }
+
+    results: list[tuple[dict[str, Any] | None, str | None]] = []
+    for key in keys:
+        url = url_by_key[key]
+        if not url:
+            results.append((None, "Unable to fetch forecast data for this location."))
+        elif not doc_by_url[url]:
+            results.append((None, "Unable to fetch detailed forecast."))
+        else:
+            results.append((doc_by_url[url], None))
+    return results
+
+
+ALERT_SEVERITIES = ("Extreme", "Severe", "Moderate", "Minor", "Unknown")
+
+
+def normalize_severity(severity: str) -> str | None:
+    """
+    Normalize a comma-separated severity filter to NWS spelling.
+
+    Args:
+        severity: e.g. "severe" or "Extreme,Severe"
+
+    Returns:
+        The normalized filter, or None if any value is not a known severity
+    """
+    values = [value.strip().capitalize() for value in severity.split(",") if value.strip()]
+    if not values or any(value not in ALERT_SEVERITIES for value in values):
+        return None
+    return ",".join(values)
+
+
+async def fetch_alerts(
+    state: str,
+    severity: Optional[str] = None,
+    event: Optional[str] = None,
+    zone: Optional[str] = None,
+) -> dict[str, Any] | None:
+    """
+    Fetch active alerts GeoJSON through the alerts cache.
+
+    Filters are pushed down to the NWS query parameters, so only matching
+    alerts are downloaded. A zone replaces the state as the location filter
+    because NWS accepts a single location parameter.
+
+    Args:
+        state: Two-letter US state code
+        severity: Optional normalized severity filter, e.g. "Extreme,Severe"
+        event: Optional event name filter, e.g. "Flood Warning"
+        zone: Optional NWS zone ID, e.g. "CAZ041"
+
+    Returns:
+        The alerts FeatureCollection, or None if it could not be fetched
+    """
+    if not (severity or event or zone):
+        url = f"{NWS_API_BASE}/alerts/active/area/{state.strip().upper()}"
+        return await fetch_cached(url, alerts_cache)
+
+    params = {}
+    if zone:
+        params["zone"] = zone.strip().upper()
+    else:
+        params["area"] = state.strip().upper()
+    if severity:
+        params["severity"] = severity
+    if event:
+        params["event"] = event.strip()
+    url = f"{NWS_API_BASE}/alerts/active?{urlencode(sorted(params.items()))}"
+    return await fetch_cached(url, alerts_cache)
+
+
+def paginate(items: list, limit: Optional[int], cursor: Optional[str]) -> tuple[list, Optional[str], str | None]:
+    """
+    Slice a list for cursor-based paging.
+
+    The cursor is the opaque offset of the next page as returned by the
+    previous call. Pages are taken from the same cached document, so they
+    stay consistent while the cache entry is fresh.
+
+    Args:
+        items: Full list to page through
+        limit: Maximum items per page, or None for all remaining items
+        cursor: Cursor returned by the previous page, or None for the first
+
+    Returns:
+        (page, next cursor or None, error message or None)
+    """
+    try:
+        start = int(cursor) if cursor else 0
+    except ValueError:
+        return [], None, f"Invalid cursor: {cursor}"
+    if start < 0 or (limit is not None and limit < 1):
+        return [], None, "Cursor must be >= 0 and limit must be >= 1."
+    end = len(items) if limit is None else min(start + limit, len(items))
+    next_cursor = str(end) if end < len(items) else None
+    return items[start:end], next_cursor, None
+
+
+def _collect_metrics():
+    stats = cache_stats()
+    lookups, ratios, sizes = [], [], []
+    for name in ("points", "alerts", "forecast"):
+        cache = stats[name]
+        for result in ("hits", "shared_hits", "revalidated", "misses", "stale_served"):
+            if result in cache:
+                lookups.append(("", {"cache": name, "result": result}, cache[result]))
+        ratios.append(("", {"cache": name}, cache["hit_ratio"]))
+        sizes.append(("", {"cache": name}, cache["size"]))
+    flights = stats["in_flight"]
+    return [
+        ("nws_cache_lookups_total", "counter", "NWS cache lookups by cache and result.", lookups),
+        ("nws_cache_hit_ratio", "gauge", "Share of NWS cache lookups served without a full download.", ratios),
+        ("nws_cache_entries", "gauge", "Entries held in each NWS cache.", sizes),
+        ("nws_coalesced_requests_total", "counter", "NWS fetches that joined an identical fetch already in flight.",
+         [("", {}, flights["followers"])]),
+        ("nws_refresh_prefetched_total", "counter", "Documents refreshed ahead of expiry by the background scheduler.",
+         [("", {}, stats["refresher"]["prefetched"])]),
+    ]
+
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+def cache_stats() -> dict[str, Any]:
+    """Return counters for every NWS cache."""
+    return {
+        "points": points_cache.stats(),
+        "alerts": alerts_cache.stats(),
+        "forecast": forecast_cache.stats(),
+        "in_flight": nws.flights.stats(),
+        "refresher": refresher.stats(),
+        "shared": shared_store.stats() if shared_store is not None else None,
+    }
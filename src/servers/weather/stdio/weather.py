@@ -1,32 +1,24 @@
-from typing import Any
-import httpx
+import json
+
 from mcp.server.fastmcp import FastMCP
 
-# 初始化 FastMCP 伺服器
-mcp = FastMCP("Weather")
+from nws_client import (
+    ALERT_SEVERITIES,
+    BATCH_MAX_LOCATIONS,
+    Location,
+    cache_stats,
+    fetch_alerts,
+    fetch_forecast,
+    fetch_forecasts_batch,
+    normalize_severity,
+    nws_lifespan,
+    paginate,
+    resolve_forecast_url,
+)
 
-# 常數
-NWS_API_BASE_URL = "https://api.weather.gov"
-USER_AGENT = "weather-app/1.0"
+# 初始化 FastMCP 伺服器，生命週期內共用 NWS 連線池
+mcp = FastMCP("Weather", lifespan=nws_lifespan)
 
-async def make_nws_request(url: str) -> dict[str, Any] | None:
-    """
-    發送 HTTP 請求到 NOAA 天氣 API 並返回 JSON 響應
-    """
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json",
-    }
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error occurred: {e}")
-            return None
-        
 def format_alert(feature: dict) -> str:
     """
     格式化 NOAA 警報資料
@@ -40,27 +32,66 @@ Description: {props.get("description", "No description available")}
 Instructions: {props.get("instruction", "No specific instructions provided")}
 """
 
+def format_period(period: dict) -> str:
+    """
+    格式化 NOAA 預報時段資料
+    """
+    return f"""
+{period['name']}:
+Temperature: {period['temperature']}°{period['temperatureUnit']}
+Wind: {period['windSpeed']} {period['windDirection']}
+Forecast: {period['detailedForecast']}
+"""
+
 @mcp.tool()
-async def get_alerts(state: str) -> str:
+async def get_alerts(
+    state: str,
+    severity: str | None = None,
+    event: str | None = None,
+    zone: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> str:
     """
     獲取美國特定州份的警報資料.
 
     Args:
         state (str): 美國州份的縮寫 (e.g., "CA", "TX", "NY")
+        severity (str): 只回傳此嚴重程度的警報：Extreme、Severe、Moderate、Minor 或 Unknown（多個以逗號分隔）
+        event (str): 只回傳此事件類型的警報 (e.g., "Flood Warning")
+        zone (str): 只回傳此 NWS 分區的警報 (e.g., "CAZ041")，取代整個州份
+        limit (int): 最多回傳的警報數
+        cursor (str): 前一次回應提供的游標，用於取得下一頁
         
     Returns:
         str: 警報資料的文字描述
     """
-    url = f"{NWS_API_BASE_URL}/alerts/active/area/{state}"
-    data = await make_nws_request(url)
+    if severity:
+        severity = normalize_severity(severity)
+        if severity is None:
+            return f"Invalid severity. Use one of: {', '.join(ALERT_SEVERITIES)}."
+
+    data = await fetch_alerts(state, severity=severity, event=event, zone=zone)
     
     if not data or "features" not in data:
         return "Unable to fetch alerts or no alerts found."
     
-    if not data["features"]:
+    features = data["features"]
+    if not features:
+        if severity or event or zone:
+            return "No active alerts match the given filters."
         return "No active alerts found for the given state."
+
+    # 依游標分頁
+    page, next_cursor, error = paginate(features, limit, cursor)
+    if error:
+        return error
+    if not page:
+        return "No more alerts."
     
-    alerts = [format_alert(feature) for feature in data["features"]]
+    alerts = [format_alert(feature) for feature in page]
+    if next_cursor:
+        alerts.append(f"Showing {len(page)} of {len(features)} alerts. Next cursor: {next_cursor}")
     return "\n\n".join(alerts)
 
 @mcp.tool()
@@ -72,33 +103,59 @@ async def get_forecast(latitude: float, longitude: float) -> str:
         latitude (float): 緯度
         longitude (float): 經度
     """
-    # 首先取得預測網格端點
-    points_url = f"{NWS_API_BASE_URL}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
+    # 首先取得預測網格端點（依座標快取）
+    forecast_url = await resolve_forecast_url(latitude, longitude)
 
-    if not points_data:
+    if not forecast_url:
         return "Unable to fetch forecast data for this location."
     
     # 從端點取得詳細預報
-    forecast_url = points_data["properties"]["forecast"]
-    forecast_data = await make_nws_request(forecast_url)
+    forecast_data = await fetch_forecast(forecast_url)
 
     if not forecast_data:
         return "Unable to fetch detailed forecast."
     
     periods = forecast_data["properties"]["periods"]
-    forecasts = []
+    forecasts = [format_period(period) for period in periods[:5]]
+    return "\n\n".join(forecasts)
 
-    for period in periods[:5]:
-        forecast = f"""
-{period['name']}:
-Temperature: {period['temperature']}°{period['temperatureUnit']}
-Wind: {period['windSpeed']} {period['windDirection']}
-Forecast: {period['detailedForecast']}
-"""
-        forecasts.append(forecast)
+@mcp.tool()
+async def get_forecasts_batch(locations: list[Location]) -> str:
+    """
+    一次獲取多個位置的預報資料
 
-    return "\n\n".join(forecasts)
+    位置會並行查詢，共用同一預報網格的位置只會查詢一次；單一位置失敗不影響其他位置。
+
+    Args:
+        locations (list): 位置列表，每項為 {"latitude": 緯度, "longitude": 經度}（最多 50 個）
+
+    Returns:
+        str: 每個位置的預報或錯誤訊息
+    """
+    if not locations:
+        return "No locations given."
+    if len(locations) > BATCH_MAX_LOCATIONS:
+        return f"Too many locations: {len(locations)} given, at most {BATCH_MAX_LOCATIONS} allowed."
+
+    coordinates = [(location["latitude"], location["longitude"]) for location in locations]
+    results = await fetch_forecasts_batch(coordinates)
+
+    sections = []
+    for index, ((latitude, longitude), (forecast_data, error)) in enumerate(zip(coordinates, results), start=1):
+        header = f"=== Location {index} ({latitude}, {longitude}) ==="
+        if error:
+            sections.append(f"{header}\nError: {error}")
+            continue
+        periods = forecast_data["properties"]["periods"]
+        sections.append(header + "\n\n".join(format_period(period) for period in periods[:5]))
+    return "\n\n".join(sections)
+
+@mcp.resource("weather://stats")
+async def get_stats() -> str:
+    """
+    獲取 NWS 快取的命中/未命中統計
+    """
+    return json.dumps(cache_stats())
 
 if __name__ == "__main__":
     # Initialize and run the server
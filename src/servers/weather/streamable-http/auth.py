@@ -0,0 +1,203 @@
+"""
+API Key Authentication Middleware
+
+A pure ASGI middleware that authenticates each MCP connection or session once,
+keeps the resolved user on the ASGI scope, and passes response messages
+through untouched so long-lived SSE / streamable-http streams are never
+buffered or wrapped in extra tasks. Authenticated requests are also subject
+to the per-key and global request rate limits in `ratelimit.py`.
+"""
+
+import json
+import re
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import parse_qs
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import AUTH_REJECTIONS, HTTP_IN_FLIGHT, SESSIONS_ACTIVE
+from ratelimit import RateLimiter, http_limiter, retry_after
+from user_db import User, get_user_by_api_key
+
+# Paths that never require an API key (/metrics checks its own token)
+PUBLIC_PATHS = frozenset(["/docs", "/redoc", "/openapi.json", "/metrics"])
+
+# Header streamable-http clients send on every request after initialization
+MCP_SESSION_ID_HEADER = b"mcp-session-id"
+
+# The SSE transport announces the message endpoint as "...?session_id=<hex>"
+SSE_SESSION_ID_PATTERN = re.compile(rb"session_id=([0-9a-f]{32})")
+
+# Stop looking for the endpoint event after this many bytes of an SSE stream
+SSE_SCAN_LIMIT = 4096
+
+UNAUTHORIZED_BODY = json.dumps({"detail": "Invalid or missing API key"}).encode()
+RATE_LIMITED_BODY = json.dumps({"detail": "Rate limit exceeded"}).encode()
+
+
+class APIKeyMiddleware:
+    """
+    Middleware for API key authentication.
+    Accepts API key either via x-api-key header, as a Bearer token, or as a query parameter.
+
+    The key is checked once per MCP session. When an SSE stream or a
+    streamable-http session is opened, the session ID issued by the server is
+    bound to the authenticated user; later requests carrying that session ID
+    (the SSE `/messages` posts or the `mcp-session-id` header) reuse the bound
+    user without another key lookup. Requests with neither a known session nor
+    a valid key are rejected with 401, and requests over the user's rate limit
+    with 429 and a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_sessions: int = 10000,
+        limiter: Optional[RateLimiter] = http_limiter,
+    ):
+        self.app = app
+        self.max_sessions = max_sessions
+        self.limiter = limiter
+        self.sessions: OrderedDict[str, User] = OrderedDict()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+        # Requests inside an already authenticated session
+        session_id = headers.get(MCP_SESSION_ID_HEADER, b"").decode("latin-1") or query.get("session_id", [""])[0]
+        user = self.sessions.get(session_id) if session_id else None
+
+        if user is None:
+            api_key = self._api_key(headers, query)
+            user = get_user_by_api_key(api_key) if api_key else None
+            if user is None:
+                AUTH_REJECTIONS.inc("invalid_key" if api_key else "missing_key")
+                await self._unauthorized(send)
+                return
+
+        if self.limiter is not None:
+            wait = self.limiter.acquire(user)
+            if wait > 0:
+                AUTH_REJECTIONS.inc("rate_limited")
+                await self._rate_limited(send, wait)
+                return
+
+        scope["user"] = user
+        scope.setdefault("state", {})["user"] = user
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self._dispatch(scope, receive, send, user, session_id)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+
+    async def _dispatch(self, scope: Scope, receive: Receive, send: Send, user: User, session_id: str) -> None:
+        if scope["method"] == "DELETE" and session_id:
+            # Client is closing a streamable-http session
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._unbind(session_id)
+            return
+
+        if session_id:
+            await self.app(scope, receive, send)
+            return
+
+        # A request outside any session may open one: bind its ID to the user
+        opened: list[str] = []
+        await self.app(scope, receive, self._session_binder(send, user, opened))
+        # An SSE session ends when its stream does
+        if scope["method"] == "GET":
+            for sid in opened:
+                self._unbind(sid)
+
+    @staticmethod
+    def _api_key(headers: dict, query: dict) -> str:
+        # 1. HEADER AUTHENTICATION
+        api_key = headers.get(b"x-api-key", b"").decode("latin-1")
+
+        # 2. BEARER AUTHENTICATION
+        if not api_key:
+            auth_header = headers.get(b"authorization", b"").decode("latin-1")
+            if auth_header.startswith("Bearer "):
+                api_key = auth_header[7:]  # Remove "Bearer " prefix
+
+        # 3. QUERY PARAMETER AUTHENTICATION
+        if not api_key:
+            api_key = query.get("api_key", [""])[0]
+
+        return api_key
+
+    def _bind(self, session_id: str, user: User) -> None:
+        self.sessions[session_id] = user
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        SESSIONS_ACTIVE.set(len(self.sessions))
+
+    def _unbind(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+        SESSIONS_ACTIVE.set(len(self.sessions))
+
+    def _session_binder(self, send: Send, user: User, opened: list[str]) -> Send:
+        """Wrap `send` to pick up the session ID from the response, then get out of the way."""
+        scanned = 0
+        scanning = False
+
+        async def binder(message: Message) -> None:
+            nonlocal scanned, scanning
+            if message["type"] == "http.response.start":
+                for name, value in message.get("headers", []):
+                    name = name.lower()
+                    if name == MCP_SESSION_ID_HEADER:
+                        sid = value.decode("latin-1")
+                        self._bind(sid, user)
+                        opened.append(sid)
+                    elif name == b"content-type" and value.startswith(b"text/event-stream"):
+                        scanning = not opened
+            elif scanning and message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                match = SSE_SESSION_ID_PATTERN.search(body)
+                scanned += len(body)
+                if match:
+                    sid = match.group(1).decode("ascii")
+                    self._bind(sid, user)
+                    opened.append(sid)
+                if match or scanned > SSE_SCAN_LIMIT:
+                    scanning = False
+            await send(message)
+
+        return binder
+
+    @staticmethod
+    async def _unauthorized(send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 401,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(UNAUTHORIZED_BODY)).encode()),
+                (b"www-authenticate", b"Bearer"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": UNAUTHORIZED_BODY})
+
+    @staticmethod
+    async def _rate_limited(send: Send, wait: float) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(RATE_LIMITED_BODY)).encode()),
+                (b"retry-after", str(retry_after(wait)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": RATE_LIMITED_BODY})
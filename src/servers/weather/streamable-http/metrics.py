@@ -0,0 +1,226 @@
+"""
+Prometheus Metrics
+
+A small in-process metrics registry rendered in the Prometheus text
+exposition format, so the weather servers can expose `/metrics` without an
+extra dependency. Metrics are plain counters, gauges and histograms keyed by
+label values; values that already live elsewhere (cache counters, rate limit
+buckets) are read at scrape time through collector functions instead of
+being mirrored on every update.
+
+The `/metrics` endpoint is exempt from API key authentication. When
+WEATHER_METRICS_TOKEN is set, scrapes must send it as a Bearer token.
+"""
+
+import functools
+import hmac
+import os
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+# Latency buckets in seconds, from cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (metric name, type, help, [(sample suffix, labels, value)])
+Family = tuple[str, str, str, list[tuple[str, dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class for a metric family with a fixed set of label names."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labelvalues: tuple) -> dict[str, str]:
+        return dict(zip(self.labelnames, labelvalues))
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A monotonically increasing count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        # An unlabeled series is reported as 0 before its first update
+        self._values: dict[tuple, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        return [("", self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A value per label set that can go up and down."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        # An unlabeled series is reported as 0 before its first update
+        self._values: dict[tuple, float] = {} if self.labelnames else {(): 0.0}
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        return [("", self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count of observations per label set."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [per-bucket counts..., sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        series = self._values.get(labelvalues)
+        if series is None:
+            series = self._values[labelvalues] = [0.0] * (len(self.buckets) + 1)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-1] += value
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        samples = []
+        for key, series in self._values.items():
+            labels = self._labels(key)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, series[-1]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """Metric families plus collectors that produce families at scrape time."""
+
+    def __init__(self):
+        self._metrics: list[Metric] = []
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        families: list[Family] = [(m.name, m.type, m.help, m.samples()) for m in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+
+        lines = []
+        for name, type_, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type_}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TOOL_CALLS = REGISTRY.register(Counter(
+    "weather_tool_calls_total", "MCP tool calls by tool and outcome.", ["tool", "outcome"]))
+TOOL_DURATION = REGISTRY.register(Histogram(
+    "weather_tool_duration_seconds", "MCP tool call latency.", ["tool"]))
+TOOLS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "weather_tool_calls_in_flight", "MCP tool calls currently running.", ["tool"]))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "weather_http_requests_in_flight", "Authenticated HTTP requests and streams currently open."))
+SESSIONS_ACTIVE = REGISTRY.register(Gauge(
+    "weather_mcp_sessions_active", "MCP sessions bound to an authenticated user."))
+AUTH_REJECTIONS = REGISTRY.register(Counter(
+    "weather_auth_rejections_total", "Requests rejected by the API key middleware.", ["reason"]))
+UPSTREAM_DURATION = REGISTRY.register(Histogram(
+    "nws_request_duration_seconds", "NWS API request latency by endpoint and status.", ["endpoint", "status"]))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "nws_requests_in_flight", "NWS API requests currently waiting for a response."))
+
+
+def instrument_tool(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Count and time calls of an async MCP tool function."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        TOOLS_IN_FLIGHT.inc(name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            TOOL_DURATION.observe(time.perf_counter() - started, name)
+            TOOL_CALLS.inc(name, outcome)
+            TOOLS_IN_FLIGHT.dec(name)
+
+    return wrapper
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Serve the registry, checking WEATHER_METRICS_TOKEN when it is set."""
+    token = os.getenv("WEATHER_METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return PlainTextResponse("Unauthorized\n", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
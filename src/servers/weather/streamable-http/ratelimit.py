@@ -0,0 +1,243 @@
+"""
+Token-bucket rate limiting for the weather HTTP servers.
+
+Two independent limiters are applied:
+
+    http_limiter  every authenticated HTTP request, checked in APIKeyMiddleware
+    tool_limiter  tool calls that may reach the NWS API, checked in the tools
+
+Each limiter keeps one bucket per user (API key), sized by the user's role,
+plus one global bucket shared by everyone. A request must fit in both; when
+it does not, it is rejected immediately with the number of seconds until it
+would fit, so callers can send a Retry-After hint instead of queueing.
+
+Limits are configured as "<tokens per second>:<burst>" (a value of 0 disables
+that bucket):
+
+    WEATHER_RATE_HTTP_ADMIN      (default 50:100)
+    WEATHER_RATE_HTTP_DEVELOPER  (default 10:30)
+    WEATHER_RATE_HTTP_VIEWER     (default 2:10; also used for unknown roles)
+    WEATHER_RATE_HTTP_GLOBAL     (default 200:400)
+    WEATHER_RATE_TOOL_ADMIN      (default 10:20)
+    WEATHER_RATE_TOOL_DEVELOPER  (default 2:10)
+    WEATHER_RATE_TOOL_VIEWER     (default 0.5:5; also used for unknown roles)
+    WEATHER_RATE_TOOL_GLOBAL     (default 20:50)
+    WEATHER_RATE_MAX_KEYS        Maximum per-key buckets tracked (default 10000)
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metrics import REGISTRY
+from user_db import User
+
+# (tokens per second, burst)
+Limit = Tuple[float, float]
+
+DEFAULT_ROLE = "viewer"
+
+DEFAULT_LIMITS: Dict[str, Dict[str, Limit]] = {
+    "HTTP": {
+        "admin": (50.0, 100.0),
+        "developer": (10.0, 30.0),
+        "viewer": (2.0, 10.0),
+        "global": (200.0, 400.0),
+    },
+    "TOOL": {
+        "admin": (10.0, 20.0),
+        "developer": (2.0, 10.0),
+        "viewer": (0.5, 5.0),
+        "global": (20.0, 50.0),
+    },
+}
+
+
+def _env_limit(name: str, default: Limit) -> Optional[Limit]:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return rate, float(burst) if burst else rate
+
+
+class TokenBucket:
+    """A bucket holding up to `burst` tokens, refilled at `rate` tokens per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)."""
+        missing = min(cost, self.burst) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.burst)
+
+    def is_full(self) -> bool:
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """
+    Per-key and global token buckets.
+
+    Per-key buckets are created on first use and dropped again once they have
+    refilled completely, since a full bucket behaves exactly like a new one.
+    At most `max_keys` buckets are tracked; the least recently used ones are
+    dropped first.
+    """
+
+    def __init__(
+        self,
+        role_limits: Dict[str, Optional[Limit]],
+        global_limit: Optional[Limit] = None,
+        max_keys: int = 10000,
+    ):
+        self.role_limits = role_limits
+        self.global_bucket = TokenBucket(*global_limit) if global_limit else None
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.rejected_global = 0
+
+    @classmethod
+    def from_env(cls, scope: str) -> "RateLimiter":
+        """Build a limiter from the WEATHER_RATE_<scope>_* environment variables."""
+        defaults = DEFAULT_LIMITS[scope]
+        role_limits = {
+            role: _env_limit(f"WEATHER_RATE_{scope}_{role.upper()}", limit)
+            for role, limit in defaults.items()
+            if role != "global"
+        }
+        return cls(
+            role_limits,
+            global_limit=_env_limit(f"WEATHER_RATE_{scope}_GLOBAL", defaults["global"]),
+            max_keys=int(os.getenv("WEATHER_RATE_MAX_KEYS", "10000")),
+        )
+
+    def _bucket_for(self, user: User) -> Optional[TokenBucket]:
+        bucket = self.buckets.get(user.username)
+        if bucket is not None:
+            self.buckets.move_to_end(user.username)
+            return bucket
+        limit = self.role_limits.get(user.role, self.role_limits.get(DEFAULT_ROLE))
+        if limit is None:
+            return None
+        bucket = self.buckets[user.username] = TokenBucket(*limit)
+        if len(self.buckets) > self.max_keys:
+            self.prune()
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return bucket
+
+    def acquire(self, user: Optional[User], cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens from the user's bucket and the global bucket.
+
+        Args:
+            user: The authenticated user, or None to only apply the global limit
+            cost: Tokens to take; costs above a bucket's burst take the whole bucket
+
+        Returns:
+            0 if the request is allowed, otherwise the seconds to wait before
+            retrying (nothing is taken in that case)
+        """
+        now = time.monotonic()
+        buckets = []
+        if user is not None:
+            bucket = self._bucket_for(user)
+            if bucket is not None:
+                buckets.append(bucket)
+        if self.global_bucket is not None:
+            buckets.append(self.global_bucket)
+
+        wait = 0.0
+        for bucket in buckets:
+            bucket.refill(now)
+            wait = max(wait, bucket.wait_time(cost))
+        if wait > 0:
+            self.rejected += 1
+            if self.global_bucket is not None and self.global_bucket.wait_time(cost) > 0:
+                self.rejected_global += 1
+            return wait
+
+        for bucket in buckets:
+            bucket.take(cost)
+        self.allowed += 1
+        return 0.0
+
+    def prune(self) -> None:
+        """Drop per-key buckets that have refilled completely."""
+        now = time.monotonic()
+        full = []
+        for key, bucket in self.buckets.items():
+            bucket.refill(now)
+            if bucket.is_full():
+                full.append(key)
+        for key in full:
+            del self.buckets[key]
+
+    def stats(self) -> Dict:
+        """Return counters and current bucket levels (tokens left / burst)."""
+        self.prune()
+        global_level = None
+        if self.global_bucket is not None:
+            self.global_bucket.refill(time.monotonic())
+            global_level = round(self.global_bucket.tokens, 2)
+        return {
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "rejected_global": self.rejected_global,
+            "global": global_level,
+            "keys": {key: round(bucket.tokens, 2) for key, bucket in self.buckets.items()},
+        }
+
+
+def retry_after(wait: float) -> int:
+    """Round a wait time up to the whole seconds used in Retry-After."""
+    return max(1, math.ceil(wait))
+
+
+http_limiter = RateLimiter.from_env("HTTP")
+tool_limiter = RateLimiter.from_env("TOOL")
+
+
+def rate_limit_stats() -> Dict:
+    """Return stats for both limiters."""
+    return {"http": http_limiter.stats(), "tool": tool_limiter.stats()}
+
+
+def _collect_metrics():
+    decisions, global_tokens, key_tokens = [], [], []
+    for name, stats in rate_limit_stats().items():
+        decisions.append(("", {"limiter": name, "decision": "allowed"}, stats["allowed"]))
+        decisions.append(("", {"limiter": name, "decision": "rejected"}, stats["rejected"]))
+        if stats["global"] is not None:
+            global_tokens.append(("", {"limiter": name}, stats["global"]))
+        for user, tokens in stats["keys"].items():
+            key_tokens.append(("", {"limiter": name, "user": user}, tokens))
+    return [
+        ("weather_rate_limit_decisions_total", "counter", "Rate limit decisions by limiter.", decisions),
+        ("weather_rate_limit_global_tokens", "gauge", "Tokens left in the global bucket.", global_tokens),
+        ("weather_rate_limit_tokens", "gauge", "Tokens left in per-user buckets that are not full.", key_tokens),
+    ]
+
+
+REGISTRY.add_collector(_collect_metrics)
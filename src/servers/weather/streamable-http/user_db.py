@@ -1,65 +1,352 @@
 """
-Mock User Database with API Keys
+User Database with API Keys
 
-This module provides a simple in-memory user database with API keys for authentication.
+This module provides the API key store used for authentication. Keys are
+never kept in plaintext: every backend stores and looks up the SHA-256 digest
+of the key, so authenticating a request is one hash plus one indexed lookup
+regardless of how many keys exist.
+
+The backend is selected with the WEATHER_KEYSTORE environment variable:
+
+    (unset)                    Built-in demo users below
+    path/to/users.json         JSON file, reloaded when it changes on disk
+    sqlite:///path/to/keys.db  SQLite database, picks up committed changes
+
+Lookups go through an in-process read-through cache that also remembers
+unknown keys for a short while, so repeated bad keys do not hit the backend:
+
+    WEATHER_KEYSTORE_CACHE_SIZE      Maximum cached keys (default 100000)
+    WEATHER_KEYSTORE_CACHE_TTL       Seconds a known key is cached (default 300)
+    WEATHER_KEYSTORE_NEGATIVE_TTL    Seconds an unknown key is cached (default 60)
+    WEATHER_KEYSTORE_CHECK_INTERVAL  Seconds between backend change checks (default 2)
+
+JSON file format:
+
+    {"users": {"alice": {"api_key_sha256": "<hex digest>", "full_name": "Alice Johnson", "role": "developer"}}}
+
+Manage keys from the command line:
+
+    python user_db.py hash <api_key>
+    python user_db.py add <store> <username> <full_name> <role>
 """
 
-from typing import Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+
+
+@dataclass(frozen=True, slots=True)
+class User:
+    """An authenticated user. Instances are shared, treat them as read-only."""
+    username: str
+    full_name: str
+    role: str
 
-# Simple user database with API keys
+
+def hash_api_key(api_key: str) -> str:
+    """Return the hex SHA-256 digest under which an API key is stored."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+# Built-in demo users (digests of "password123", "alicepass456" and "bobsecret789")
 users = {
     "felix": {
-        "api_key": "password123",
+        "api_key_sha256": "ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f",
         "full_name": "Felix Kewa",
         "role": "admin"
     },
     "alice": {
-        "api_key": "alicepass456",
+        "api_key_sha256": "d0b70afaadde6441f3dc80b4aab90dbf7bf7a59052b30069f50f1f4b390a47aa",
         "full_name": "Alice Johnson",
         "role": "developer"
     },
     "bob": {
-        "api_key": "bobsecret789",
+        "api_key_sha256": "6ef9674903cba2e09facaa455a17d96b4126de9d3df17bf5f61f2fb0f6813975",
         "full_name": "Bob Smith",
         "role": "viewer"
     }
 }
 
-# Lookup table to quickly find user by API key
-api_key_to_user: Dict[str, str] = {
-    user_data["api_key"]: username
-    for username, user_data in users.items()
-}
 
+def _index_users(records: Dict[str, Dict]) -> Dict[str, User]:
+    """Build a digest -> User table from {username: record} data."""
+    return {
+        record["api_key_sha256"]: User(
+            username=username,
+            full_name=record.get("full_name", username),
+            role=record.get("role", "viewer"),
+        )
+        for username, record in records.items()
+    }
+
+
+class KeyStore:
+    """
+    Interface for API key backends.
+
+    Backends look keys up by digest and report a version that changes
+    whenever their data changes, so caches in front of them can be dropped.
+    """
+
+    def load(self, key_hash: str) -> Optional[User]:
+        """Return the user owning a key digest, or None."""
+        raise NotImplementedError
+
+    def version(self) -> Hashable:
+        """Return a value that changes whenever the stored keys change."""
+        return None
+
+    def reload(self) -> None:
+        """Re-read the backing data after a version change."""
+
+
+class MemoryKeyStore(KeyStore):
+    """Keys held in a dictionary, e.g. the built-in demo users."""
+
+    def __init__(self, records: Dict[str, Dict]):
+        self._users = _index_users(records)
+
+    def load(self, key_hash: str) -> Optional[User]:
+        return self._users.get(key_hash)
+
+
+class JSONFileKeyStore(KeyStore):
+    """Keys loaded from a JSON file and re-read when the file changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._users: Dict[str, User] = {}
+        self.reload()
+
+    def load(self, key_hash: str) -> Optional[User]:
+        return self._users.get(key_hash)
+
+    def version(self) -> Hashable:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._users = _index_users(data.get("users", {}))
+        except (OSError, ValueError, KeyError) as e:
+            # Keep serving the previous keys if the file is mid-write or broken
+            print(f"Failed to load API keys from {self.path}: {e}")
+
+
+class SQLiteKeyStore(KeyStore):
+    """Keys stored in an SQLite table indexed by digest."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS api_keys (
+            key_hash TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            role TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(self.SCHEMA)
+        self._conn.commit()
+
+    def load(self, key_hash: str) -> Optional[User]:
+        row = self._conn.execute(
+            "SELECT username, full_name, role FROM api_keys WHERE key_hash = ?", (key_hash,)
+        ).fetchone()
+        return User(*row) if row else None
+
+    def version(self) -> Hashable:
+        # data_version changes whenever another connection commits
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def add(self, key_hash: str, user: User) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO api_keys VALUES (?, ?, ?, ?)",
+            (key_hash, user.username, user.full_name, user.role),
+        )
+        self._conn.commit()
+
+
+class CachedKeyStore:
+    """
+    Read-through cache in front of a KeyStore.
+
+    Known keys are cached for `ttl` seconds and unknown keys for
+    `negative_ttl` seconds, in one LRU table bounded by `maxsize`. The
+    backend's version is checked at most every `check_interval` seconds and
+    the cache is dropped when it changes, so edits take effect without a
+    restart.
+    """
+
+    def __init__(
+        self,
+        backend: KeyStore,
+        maxsize: int = 100000,
+        ttl: float = 300.0,
+        negative_ttl: float = 60.0,
+        check_interval: float = 2.0,
+    ):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.check_interval = check_interval
+        self._entries: OrderedDict[str, tuple[float, Optional[User]]] = OrderedDict()
+        self._version = backend.version()
+        self._next_check = time.monotonic() + check_interval
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
 
-def get_user_by_api_key(api_key: str) -> Optional[Dict]:
+    def _check_version(self, now: float) -> None:
+        self._next_check = now + self.check_interval
+        version = self.backend.version()
+        if version != self._version:
+            self._version = version
+            self.backend.reload()
+            self._entries.clear()
+            self.reloads += 1
+
+    def get(self, api_key: str) -> Optional[User]:
+        """
+        Resolve an API key to its user.
+
+        Args:
+            api_key: The API key to look up
+
+        Returns:
+            The user if the key is valid, None otherwise
+        """
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._check_version(now)
+
+        key_hash = hash_api_key(api_key)
+        entry = self._entries.get(key_hash)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key_hash)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        user = self.backend.load(key_hash)
+        self._entries[key_hash] = (now + (self.ttl if user else self.negative_ttl), user)
+        self._entries.move_to_end(key_hash)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return user
+
+    def stats(self) -> Dict:
+        """Return cache counters."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+def open_keystore(spec: Optional[str]) -> KeyStore:
+    """
+    Open the backend described by a WEATHER_KEYSTORE value.
+
+    Args:
+        spec: "sqlite:///path", a JSON file path, or None for the demo users
+
+    Returns:
+        The KeyStore backend
+    """
+    if not spec:
+        return MemoryKeyStore(users)
+    if spec.startswith("sqlite:///"):
+        return SQLiteKeyStore(spec[len("sqlite:///"):])
+    return JSONFileKeyStore(spec)
+
+
+keystore = CachedKeyStore(
+    open_keystore(os.getenv("WEATHER_KEYSTORE")),
+    maxsize=int(os.getenv("WEATHER_KEYSTORE_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("WEATHER_KEYSTORE_CACHE_TTL", "300")),
+    negative_ttl=float(os.getenv("WEATHER_KEYSTORE_NEGATIVE_TTL", "60")),
+    check_interval=float(os.getenv("WEATHER_KEYSTORE_CHECK_INTERVAL", "2")),
+)
+
+
+def get_user_by_api_key(api_key: str) -> Optional[User]:
     """
     Retrieve a user by their API key.
-    
+
     Args:
         api_key: The API key to look up
-        
+
     Returns:
-        The user data dictionary if found, None otherwise
+        The shared User record if found, None otherwise
     """
-    if api_key not in api_key_to_user:
-        return None
-    
-    username = api_key_to_user[api_key]
-    return {
-        "username": username,
-        **users[username]
-    }
+    return keystore.get(api_key)
 
 
 def validate_api_key(api_key: str) -> bool:
     """
     Check if an API key is valid.
-    
+
     Args:
         api_key: The API key to validate
-        
+
     Returns:
         True if the API key exists, False otherwise
     """
-    return api_key in api_key_to_user 
\ No newline at end of file
+    return keystore.get(api_key) is not None
+
+
+if __name__ == "__main__":
+    import argparse
+    import secrets
+
+    parser = argparse.ArgumentParser(description="Manage weather server API keys")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    hash_parser = subparsers.add_parser("hash", help="Print the stored digest of an API key")
+    hash_parser.add_argument("api_key")
+    add_parser = subparsers.add_parser("add", help="Create a user with a new random API key")
+    add_parser.add_argument("store", help="JSON file path or sqlite:///path")
+    add_parser.add_argument("username")
+    add_parser.add_argument("full_name")
+    add_parser.add_argument("role", choices=["admin", "developer", "viewer"])
+    args = parser.parse_args()
+
+    if args.command == "hash":
+        print(hash_api_key(args.api_key))
+    else:
+        api_key = secrets.token_urlsafe(32)
+        key_hash = hash_api_key(api_key)
+        if args.store.startswith("sqlite:///"):
+            SQLiteKeyStore(args.store[len("sqlite:///"):]).add(
+                key_hash, User(args.username, args.full_name, args.role)
+            )
+        else:
+            data = {"users": {}}
+            if os.path.exists(args.store):
+                with open(args.store, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            data.setdefault("users", {})[args.username] = {
+                "api_key_sha256": key_hash,
+                "full_name": args.full_name,
+                "role": args.role,
+            }
+            # Write then rename so a running server never reads a partial file
+            tmp_path = f"{args.store}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, args.store)
+        print(f"API key for {args.username}: {api_key}")